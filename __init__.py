@@ -11,16 +11,83 @@
 # limitations under the License.
 #
 
-from typing import Optional, Tuple
+import json
+import math
+import os
+import re
+import sys
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError
+from threading import Event, Lock, RLock, Thread, get_ident
+from typing import Callable, Optional, Tuple
 from functools import lru_cache
 from ovos_bus_client import Message
 from ovos_bus_client.session import SessionManager
 from ovos_utils.decorators import classproperty
 from ovos_utils.process_utils import RuntimeRequirements
+from ovos_utils.text_utils import remove_accents_and_punct
 from ovos_wolfram_alpha_solver import WolframAlphaSolver
 from ovos_workshop.decorators import intent_handler, common_query, fallback_handler
 from ovos_workshop.skills.fallback import FallbackSkill
 
+ANSWER_CACHE_SIZE = 256  # late common_query answers kept for repeated questions
+MAX_PROFILE_DURATION = 300  # seconds, the sampler walks every thread in the process
+
+
+class StackSampler(Thread):
+    """sampling profiler, only collects stacks that pass through this file
+
+    nothing is hooked into the interpreter, there is no overhead unless running"""
+
+    def __init__(self, duration: float, on_done: Callable,
+                 interval: float = 0.005):
+        super().__init__(daemon=True, name="wolfie-profiler")
+        self.duration = duration
+        self.interval = interval
+        self.on_done = on_done
+        self.samples = 0
+        self.elapsed = 0.0
+        self.stacks = Counter()  # "func (file:line);func2 (file:line)": samples
+        self._stopped = Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        start = time.monotonic()
+        while time.monotonic() - start < self.duration \
+                and not self._stopped.wait(self.interval):
+            self.samples += 1
+            for tid, frame in sys._current_frames().items():
+                if tid == get_ident():
+                    continue
+                stack = []
+                ours = 0  # stack depth of the outermost frame in this file
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} "
+                                 f"({os.path.basename(code.co_filename)}:"
+                                 f"{code.co_firstlineno})")
+                    if code.co_filename == __file__:
+                        ours = len(stack)
+                    frame = frame.f_back
+                if ours:
+                    self.stacks[";".join(reversed(stack[:ours]))] += 1
+        self.elapsed = time.monotonic() - start
+        self.on_done(self)
+
+    def top(self, n: int) -> list:
+        """functions most often found in the sampled stacks"""
+        funcs = Counter()
+        for stack, count in self.stacks.items():
+            for func in set(stack.split(";")):
+                funcs[func] += count
+        return [{"function": func,
+                 "samples": count,
+                 "seconds": round(count * self.elapsed / max(self.samples, 1), 3)}
+                for func, count in funcs.most_common(n)]
+
 
 class WolframAlphaSkill(FallbackSkill):
     def __init__(self, *args, **kwargs):
@@ -29,6 +96,17 @@ class WolframAlphaSkill(FallbackSkill):
         self.wolfie = WolframAlphaSolver({
             "appid": self.settings.get("api_key")
         }, translator=self.translator, detector=self.lang_detector)
+        # common_query answers are computed in worker threads so we can stop
+        # waiting once common_query stops listening, slow answers still land
+        # in self._answers for the next time the question is asked
+        self._executor = ThreadPoolExecutor(max_workers=4,
+                                            thread_name_prefix="wolfie")
+        self._pending = {}  # (query, lang, units): [Future, waiting callers]
+        self._answers = OrderedDict()  # (query, lang, units): answer
+        self._pending_lock = RLock()  # Future.cancel runs callbacks in place
+        self._bundles = {}  # lang: {voc_name: {ensure_ascii: (search, exact)}}
+        self._profiler = None
+        self._profiler_lock = Lock()
 
     @classproperty
     def runtime_requirements(self):
@@ -43,6 +121,26 @@ class WolframAlphaSkill(FallbackSkill):
                                    no_network_fallback=False,
                                    no_gui_fallback=True)
 
+    def initialize(self):
+        self.add_event(f"{self.skill_id}.profile", self.handle_profile)
+
+    @property
+    def cq_timeout(self) -> float:
+        """seconds we are allowed to spend answering a common_query question"""
+        timeout = self.settings.get("cq_timeout")
+        if timeout not in (None, ""):
+            try:
+                timeout = float(timeout)
+                if not math.isfinite(timeout):
+                    raise ValueError
+                return max(timeout, 0.5)
+            except (TypeError, ValueError):
+                self.log.error(f"Invalid cq_timeout setting: {timeout}, "
+                               f"using common_query max_response_wait")
+        cq_config = self.config_core.get("intents", {}).get("common_query", {})
+        # keep a safety margin so the answer reaches common_query in time
+        return max(cq_config.get("max_response_wait", 6) - 1, 0.5)
+
     # explicit intents
     @intent_handler("search_wolfie.intent",
                     voc_blacklist=["Help"])
@@ -114,6 +212,7 @@ class WolframAlphaSkill(FallbackSkill):
         if self.voc_match(phrase, "MiscBlacklist"):
             return
 
+        deadline = time.monotonic() + self.cq_timeout
         sess = SessionManager.get()
         self.session_results[sess.session_id] = {"phrase": phrase,
                                                  "image": None,
@@ -121,7 +220,8 @@ class WolframAlphaSkill(FallbackSkill):
                                                  "system_unit": sess.system_unit,
                                                  "spoken_answer": None}
 
-        response = self.ask_the_wolf(phrase, lang, sess.system_unit)
+        response = self.ask_the_wolf_until(phrase, lang, sess.system_unit,
+                                           deadline)
         if response:
             self.session_results[sess.session_id]["spoken_answer"] = response
             self.log.debug(f"WolframAlpha response: {response}")
@@ -147,6 +247,145 @@ class WolframAlphaSkill(FallbackSkill):
             WolframAlphaSolver.enable_tx = True
         return self.wolfie.spoken_answer(query, lang=lang, units=units)
 
+    def ask_the_wolf_until(self, query: str,
+                           lang: Optional[str] = None,
+                           units: Optional[str] = None,
+                           deadline: Optional[float] = None) -> Optional[str]:
+        """ask_the_wolf, but give up once the time.monotonic() deadline passes
+
+        a request already in flight keeps running in the background and its
+        result is cached, repeated questions are answered instantly once it
+        completes. requests still queued when every asker gave up are cancelled"""
+        key = (query, lang, units)
+        with self._pending_lock:
+            if key in self._answers:
+                # answered before, possibly after its asker stopped waiting
+                self._answers.move_to_end(key)
+                return self._answers[key]
+            job = self._pending.get(key)
+            if job is None:
+                # identical in-flight questions share a single api call
+                future = self._executor.submit(self.ask_the_wolf, *key)
+                job = self._pending[key] = [future, 0]
+                future.add_done_callback(lambda f: self._job_done(key, f))
+            job[1] += 1
+            future = job[0]
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        timed_out = False
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            timed_out = True
+        except CancelledError:
+            self.log.info(f"WolframAlpha question cancelled: {query}")
+        except Exception as e:
+            self.log.error(f"Failed to query wolfram alpha: ({e})")
+        finally:
+            with self._pending_lock:
+                job[1] -= 1
+                # nobody is waiting and it never started, don't spend api quota
+                dropped = not job[1] and future.cancel()
+        if dropped:
+            self.log.info(f"WolframAlpha busy, dropped queued question: {query}")
+        elif timed_out:
+            self.log.info(f"WolframAlpha took too long to answer, "
+                          f"result will be cached for next time: {query}")
+        return None
+
+    def _job_done(self, key: tuple, future: Future):
+        with self._pending_lock:
+            if self._pending.get(key, [None])[0] is future:
+                self._pending.pop(key)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._answers[key] = future.result()
+            self._answers.move_to_end(key)
+            while len(self._answers) > ANSWER_CACHE_SIZE:
+                self._answers.popitem(last=False)
+
+    # precompiled resources
+    def _get_bundle(self, lang: str) -> dict:
+        """lazily load the pre-built matchers from scripts/build_bundles.py"""
+        lang = lang.lower()
+        if lang not in self._bundles:
+            vocabs = {}
+            path = os.path.join(self.root_dir, "res", "bundles", f"{lang}.json")
+            if os.path.isfile(path):
+                with open(path) as f:
+                    bundle = json.load(f)
+                for name, voc in bundle.get("vocabs", {}).items():
+                    vocabs[name] = {
+                        ensure_ascii: (
+                            re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE),
+                            re.compile(rf"(?:{pattern})", re.IGNORECASE))
+                        for ensure_ascii, pattern in
+                        ((False, voc["pattern"]), (True, voc["ascii_pattern"]))}
+            self._bundles[lang] = vocabs
+        return self._bundles[lang]
+
+    def voc_match(self, utt: str, voc_filename: str,
+                  lang: Optional[str] = None, exact: bool = False,
+                  ensure_ascii: bool = True) -> bool:
+        voc = self._get_bundle(lang or self.lang).get(voc_filename)
+        if voc is None or not utt:
+            # not bundled, use the .voc files in locale folder
+            return super().voc_match(utt, voc_filename, lang, exact, ensure_ascii)
+        if ensure_ascii:
+            utt = remove_accents_and_punct(utt)
+        search, full = voc[ensure_ascii]
+        if exact:
+            return bool(full.fullmatch(utt))
+        return bool(search.search(utt))
+
+    # profiling
+    def handle_profile(self, message: Message):
+        """sample where the skill spends wall time for the requested duration
+
+        the folded stacks are saved in the skill data dir, eg. for flamegraph.pl
+        or speedscope, with an optional top_n summary in the reply"""
+        reply = f"{self.skill_id}.profile.response"
+        try:
+            duration = float(message.data.get("duration", 30))
+            top_n = int(message.data.get("top_n") or 0)
+            if not 0 < duration < float("inf") or top_n < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            self.log.error(f"Invalid WolframAlpha profile request: {message.data}")
+            self.bus.emit(message.reply(reply, {"error": "invalid duration or top_n"}))
+            return
+        if duration > MAX_PROFILE_DURATION:
+            self.log.warning(f"WolframAlpha profile duration capped to "
+                             f"{MAX_PROFILE_DURATION} seconds")
+            duration = MAX_PROFILE_DURATION
+
+        def on_done(profiler: StackSampler):
+            # milliseconds so short back to back captures don't overwrite
+            now = time.time()
+            name = time.strftime("profile-%Y%m%d-%H%M%S", time.localtime(now)) + \
+                f"-{int(now * 1000) % 1000:03d}.folded"
+            path = os.path.join(self.file_system.path, name)
+            try:
+                with open(path, "w") as f:
+                    for stack, count in profiler.stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+            except OSError as e:
+                self.log.error(f"Failed to save WolframAlpha profile: ({e})")
+                self.bus.emit(message.reply(reply, {"error": f"failed to save profile: {e}"}))
+                return
+            self.log.info(f"WolframAlpha profile saved: {path}")
+            data = {"path": path, "samples": profiler.samples}
+            if top_n:
+                data["summary"] = profiler.top(top_n)
+            self.bus.emit(message.reply(reply, data))
+
+        with self._profiler_lock:
+            if self._profiler is not None and self._profiler.is_alive():
+                self.log.warning("WolframAlpha profiler already running")
+                self.bus.emit(message.reply(reply, {"error": "profiler already running"}))
+                return
+            self._profiler = StackSampler(duration, on_done)
+            self._profiler.start()
+
     def can_stop(self, message: Message) -> bool:
         return False
 
@@ -158,6 +397,12 @@ class WolframAlphaSkill(FallbackSkill):
         if session.session_id == "default":
             self.gui.release()
 
+    def shutdown(self):
+        if self._profiler is not None:
+            self._profiler.stop()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        super().shutdown()
+
 
 if __name__ == "__main__":
     from ovos_utils.fakebus import FakeBus
@@ -0,0 +1,69 @@
+"""this script should run every time the contents of the translations folder change
+compiles each language into a single res/bundles/{lang}.json with pre-built
+vocabulary matchers, loaded lazily by the skill instead of many small .voc files
+
+languages whose translations hash did not change are skipped
+"""
+
+import hashlib
+import json
+import re
+from os.path import dirname
+import os
+
+from ovos_utils.bracket_expansion import expand_template
+from ovos_utils.text_utils import remove_accents_and_punct
+
+tx = f"{dirname(dirname(__file__))}/translations"
+bundles = f"{dirname(dirname(__file__))}/res/bundles"
+BUNDLE_VERSION = 2  # bump to force a rebuild when the bundle format changes
+
+
+def translations_hash(lang):
+    h = hashlib.sha256(str(BUNDLE_VERSION).encode("utf-8"))
+    for f in sorted(os.listdir(f"{tx}/{lang}")):
+        if f.endswith(".json"):
+            with open(f"{tx}/{lang}/{f}", "rb") as fi:
+                h.update(f.encode("utf-8"))
+                h.update(fi.read())
+    return h.hexdigest()
+
+
+def compile_vocab(samples):
+    # same cleanup as sync_translations.py, a sample may hold several lines
+    lines = [l.strip() for s in samples if s and s.strip() != "[UNUSED]"
+             for l in s.split("\n")]
+    lines = [l for l in lines if l and not l.startswith("#")]
+    # expand "(a|b) c" templates the same way ovos does when reading .voc files
+    samples = set([e for l in lines for e in expand_template(l.lower()) if e])
+    samples = sorted(samples, key=lambda s: (-len(s), s))  # longest match first
+    # voc_match strips accents and punctuation from both sides by default
+    ascii_samples = set([remove_accents_and_punct(s) for s in samples])
+    ascii_samples = sorted(ascii_samples, key=lambda s: (-len(s), s))
+    return {"samples": samples,
+            "pattern": "|".join(re.escape(s) for s in samples),
+            "ascii_pattern": "|".join(re.escape(s) for s in ascii_samples)}
+
+
+os.makedirs(bundles, exist_ok=True)
+for lang in os.listdir(tx):
+    digest = translations_hash(lang)
+    bundle_file = f"{bundles}/{lang.lower()}.json"
+    if os.path.isfile(bundle_file):
+        with open(bundle_file) as f:
+            if json.load(f).get("hash") == digest:
+                continue
+
+    vocabs = {}
+    if os.path.isfile(f"{tx}/{lang}/vocabs.json"):
+        with open(f"{tx}/{lang}/vocabs.json") as f:
+            data = json.load(f)
+        for fid, samples in data.items():
+            voc = compile_vocab(samples or [])
+            if voc["samples"]:
+                vocabs[fid.split("/")[-1].replace(".voc", "")] = voc
+
+    print(f"building {lang} bundle")
+    with open(bundle_file, "w") as f:
+        json.dump({"lang": lang.lower(), "hash": digest, "vocabs": vocabs},
+                  f, indent=4, ensure_ascii=False, sort_keys=True)
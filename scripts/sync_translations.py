@@ -10,6 +10,16 @@ locale = f"{dirname(dirname(__file__))}/locale"
 tx = f"{dirname(dirname(__file__))}/translations"
 
 
+def write_if_changed(path, content):
+    # avoid needless rewrites, only touch files whose translations changed
+    if os.path.isfile(path):
+        with open(path) as f:
+            if f.read() == content:
+                return
+    with open(path, "w") as f:
+        f.write(content)
+
+
 for lang in os.listdir(tx):
     intents = f"{tx}/{lang}/intents.json"
     dialogs = f"{tx}/{lang}/dialogs.json"
@@ -28,8 +38,7 @@ for lang in os.listdir(tx):
                 else:
                     p = f"{locale}/{lang.lower()}/{fid}"
                 os.makedirs(os.path.dirname(p), exist_ok=True)
-                with open(f"{locale}/{lang.lower()}/{fid}", "w") as f:
-                    f.write("\n".join(sorted(samples)))
+                write_if_changed(p, "\n".join(sorted(samples)))
 
     if os.path.isfile(dialogs):
         with open(dialogs) as f:
@@ -43,8 +52,7 @@ for lang in os.listdir(tx):
                 else:
                     p = f"{locale}/{lang.lower()}/{fid}"
                 os.makedirs(os.path.dirname(p), exist_ok=True)
-                with open(f"{locale}/{lang.lower()}/{fid}", "w") as f:
-                    f.write("\n".join(sorted(samples)))
+                write_if_changed(p, "\n".join(sorted(samples)))
 
     if os.path.isfile(vocs):
         with open(vocs) as f:
@@ -58,8 +66,7 @@ for lang in os.listdir(tx):
                 else:
                     p = f"{locale}/{lang.lower()}/{fid}"
                 os.makedirs(os.path.dirname(p), exist_ok=True)
-                with open(f"{locale}/{lang.lower()}/{fid}", "w") as f:
-                    f.write("\n".join(sorted(samples)))
+                write_if_changed(p, "\n".join(sorted(samples)))
 
     if os.path.isfile(regexes):
         with open(regexes) as f:
@@ -73,6 +80,5 @@ for lang in os.listdir(tx):
                 else:
                     p = f"{locale}/{lang.lower()}/{fid}"
                 os.makedirs(os.path.dirname(p), exist_ok=True)
-                with open(f"{locale}/{lang.lower()}/{fid}", "w") as f:
-                    f.write("\n".join(sorted(samples)))
+                write_if_changed(p, "\n".join(sorted(samples)))
 
@@ -0,0 +1,383 @@
+"""load generator for the wolfram alpha skill
+
+runs the skill and ovos-core's common_query pipeline on a FakeBus, opens N
+synthetic sessions with their own lang and unit system, and fires a mix of
+explicit intent, common_query and fallback requests at a fixed arrival rate
+
+wolfram alpha is a local http server, the real WolframAlphaSolver requests
+are redirected to it, translation is an echo stub so no remote services are used
+
+what is exercised
+- common_query: ovos-core's common_query pipeline (ovos-common-query-pipeline-plugin)
+  gathers answers with its own wait/extension logic, then the question:action
+  is emitted like ovos-core does, the skill speaks and runs its cq_callback
+- intent / fallback: the bus messages ovos-core sends once padatious or the
+  fallback service selected this skill, the matching itself is not included
+
+reports throughput, tail latency, thread count and session_results growth
+
+    python test/load/load_generator.py --sessions 50 --rate 20 --duration 60
+"""
+import argparse
+import json
+import random
+import re
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from urllib.parse import parse_qs, urlparse
+
+import requests
+import ovos_wolfram_alpha_solver
+from ovos_bus_client.message import Message
+from ovos_bus_client.session import Session
+from ovos_commonqa.opm import CommonQAService
+from ovos_plugin_manager.templates.language import LanguageTranslator
+from ovos_utils.fakebus import FakeBus
+from skill_ovos_wolfie import WolframAlphaSkill
+
+try:
+    from pyee import ExecutorEventEmitter
+except ImportError:
+    from pyee.executor import ExecutorEventEmitter
+
+SKILL_ID = "wolfie.loadtest"
+# must pass the common_query pipeline "is this a question" check in each lang
+QUESTIONS = {
+    "ca-es": "què és {n} per 42",
+    "da-dk": "hvad er {n} gange 42",
+    "de-de": "was ist {n} mal 42",
+    "en-us": "what is {n} times 42",
+    "es-es": "qué es {n} por 42",
+    "eu": "zer da {n} bider 42",
+    "fr-fr": "quel est le produit de {n} et 42",
+    "gl-es": "que é {n} por 42",
+    "it-it": "cosa fa {n} per 42",
+    "pt-pt": "o que é {n} vezes 42"
+}
+UNITS = ["metric", "imperial"]
+WORKLOADS = ["intent", "common_query", "fallback"]
+GIF = b"GIF89a\x01\x00\x01\x00\x00\x00\x00;"
+
+
+class StubWolframHandler(BaseHTTPRequestHandler):
+    """answers wolfram alpha api calls after a random delay"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        server = self.server
+        with server.lock:
+            server.calls[url.path] += 1
+        time.sleep(max(random.gauss(server.latency, server.jitter), 0))
+        if url.path == "/v1/spoken":
+            query = parse_qs(url.query).get("i", [""])[0]
+            body, ctype = f"the answer to {query} is 42".encode("utf-8"), "text/plain"
+        elif url.path == "/v1/simple":
+            body, ctype = GIF, "image/gif"
+        elif url.path == "/v2/query":
+            body, ctype = b'{"queryresult": {"pods": []}}', "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubWolframServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency: float, jitter: float):
+        super().__init__(("127.0.0.1", 0), StubWolframHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.calls = defaultdict(int)  # api path: count
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class LocalRequests:
+    """stands in for the requests module inside ovos_wolfram_alpha_solver,
+    sends every api.wolframalpha.com call to the stub server instead"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.session = requests.Session()  # keep-alive, like a long running skill
+
+    def get(self, url, **kwargs):
+        url = re.sub(r"^https?://api\.wolframalpha\.com", self.base_url, url)
+        return self.session.get(url, **kwargs)
+
+
+class EchoTranslator(LanguageTranslator):
+    """no remote translation service during load tests"""
+
+    def translate(self, text, target=None, source=None):
+        return text
+
+
+class SyntheticSession:
+    """a user with its own session id, lang and unit system"""
+
+    def __init__(self, session_id: str):
+        # Session normalizes the lang code, keep ours for the QUESTIONS lookup
+        self.lang = random.choice(sorted(QUESTIONS))
+        self.session = Session(session_id, lang=self.lang,
+                               system_unit=random.choice(UNITS))
+
+    def request(self, workload: str, n: int, request_id: int) -> Message:
+        # replies forward the context, request_id ties them to this request
+        context = {"session": self.session.serialize(),
+                   "request_id": request_id,
+                   "source": self.session.session_id, "destination": "skills"}
+        lang = self.lang
+        query = QUESTIONS[lang].format(n=n)
+        if workload == "intent":
+            return Message(f"{SKILL_ID}:search_wolfie.intent",
+                           {"query": query, "utterance": query, "lang": lang},
+                           context)
+        if workload == "common_query":
+            return Message("loadtest.common_query",
+                           {"utterance": query, "lang": lang}, context)
+        return Message(f"ovos.skills.fallback.{SKILL_ID}.request",
+                       {"utterance": query, "utterances": [query], "lang": lang,
+                        "skill_id": SKILL_ID}, context)
+
+
+class LoadHarness:
+    """open loop load, requests are scheduled on a fixed poisson arrival
+    timeline regardless of how many are still in flight. a session asks one
+    question at a time, requests wait for a free session when all are busy.
+    latency is measured from the scheduled time so a lagging sender or a
+    queue of waiting requests can't hide slow answers"""
+
+    def __init__(self, n_sessions: int, rate: float, mix: list,
+                 timeout: float, unique_queries: int,
+                 latency: float, jitter: float):
+        self.n_sessions = n_sessions
+        self.rate = rate
+        self.mix = mix
+        self.timeout = timeout
+        self.unique_queries = unique_queries
+        self.lock = threading.Lock()
+        self.ids = count()
+        self.scheduled = 0
+        self.sent = 0
+        self.backlog = deque()  # (workload, scheduled send time)
+        self.pending = {}  # request_id: (workload, scheduled send time, session)
+        self.latencies = defaultdict(list)  # workload: [seconds]
+        self.unanswered = defaultdict(int)  # workload: count
+        self.timeouts = defaultdict(int)  # workload: count
+        self.timeline = []
+
+        self.api = StubWolframServer(latency, jitter)
+        threading.Thread(target=self.api.serve_forever, daemon=True,
+                         name="stub-wolfram").start()
+        ovos_wolfram_alpha_solver.requests = LocalRequests(self.api.url)
+
+        # like the real bus client, every message is handled in its own thread
+        self.bus = FakeBus(emitter=ExecutorEventEmitter())
+        self.common_query = CommonQAService(bus=self.bus)
+        self.skill = WolframAlphaSkill()
+        self.skill._startup(self.bus, SKILL_ID)
+        self.skill.wolfie.translator = EchoTranslator()
+        while SKILL_ID not in self.common_query.common_query_skills:
+            time.sleep(0.1)  # wait for the skill to announce itself
+
+        # one local device session, so cq_callback also renders the gui
+        self.idle = [SyntheticSession("default")] + \
+            [SyntheticSession(f"loadtest-{idx}") for idx in range(1, n_sessions)]
+
+        self.bus.on("loadtest.common_query", self.handle_common_query)
+        # a request is complete on the first reply carrying its request_id
+        self.bus.on("speak", self.handle_done)
+        self.bus.on(f"ovos.skills.fallback.{SKILL_ID}.response",
+                    self.handle_fallback_response)
+
+    def handle_common_query(self, message: Message):
+        # what ovos-core's intent service does when common_query is reached
+        match = self.common_query.match([message.data["utterance"]],
+                                        message.data["lang"], message)
+        if match:
+            self.bus.emit(message.reply(match.match_type, match.match_data))
+        else:
+            self._finish(message, answered=False)
+
+    def handle_done(self, message: Message):
+        self._finish(message)
+
+    def handle_fallback_response(self, message: Message):
+        if not message.data.get("result"):
+            # successful fallbacks are completed by the speak message
+            self._finish(message, answered=False)
+
+    def _finish(self, message: Message, answered: bool = True):
+        end = time.monotonic()
+        with self.lock:
+            # unknown ids were already answered or timed out
+            req = self.pending.pop(message.context.get("request_id"), None)
+            if req is None:
+                return
+            workload, scheduled, session = req
+            self.latencies[workload].append(end - scheduled)
+            if not answered:
+                self.unanswered[workload] += 1
+            self.idle.append(session)
+        self.assign()
+
+    def assign(self):
+        """hand waiting requests to free sessions"""
+        to_send = []
+        with self.lock:
+            while self.backlog and self.idle:
+                workload, scheduled = self.backlog.popleft()
+                session = self.idle.pop(random.randrange(len(self.idle)))
+                request_id = next(self.ids)
+                self.pending[request_id] = (workload, scheduled, session)
+                self.sent += 1
+                to_send.append(session.request(
+                    workload, random.randrange(self.unique_queries), request_id))
+        for message in to_send:
+            self.bus.emit(message)
+
+    def expire(self, now: float):
+        with self.lock:
+            for request_id, (workload, scheduled, session) in list(self.pending.items()):
+                if now - scheduled > self.timeout:
+                    self.pending.pop(request_id)
+                    self.timeouts[workload] += 1
+                    self.idle.append(session)
+            while self.backlog and now - self.backlog[0][1] > self.timeout:
+                workload, _ = self.backlog.popleft()
+                self.timeouts[workload] += 1
+        self.assign()
+
+    def dispatch(self, start: float, duration: float):
+        scheduled = start
+        while True:
+            scheduled += random.expovariate(self.rate)
+            if scheduled - start >= duration:
+                break
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            workload = random.choices(WORKLOADS, weights=self.mix)[0]
+            with self.lock:
+                self.backlog.append((workload, scheduled))
+                self.scheduled += 1
+            self.assign()
+
+    def snapshot(self, elapsed: float) -> dict:
+        with self.lock:
+            completed = sum(len(l) for l in self.latencies.values())
+            lats = [l for ls in self.latencies.values() for l in ls]
+            snap = {"elapsed": round(elapsed, 1),
+                    "scheduled": self.scheduled,
+                    "sent": self.sent,
+                    "completed": completed,
+                    "in_flight": len(self.pending),
+                    "waiting_for_session": len(self.backlog)}
+        snap.update({"p99": percentile(lats, 99),
+                     "threads": threading.active_count(),
+                     "session_results": len(self.skill.session_results),
+                     "session_results_bytes": len(json.dumps(dict(self.skill.session_results))),
+                     "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+        return snap
+
+    def run(self, duration: float, report_interval: float) -> dict:
+        start = time.monotonic()
+        dispatcher = threading.Thread(target=self.dispatch, args=(start, duration),
+                                      daemon=True, name="load-dispatcher")
+        dispatcher.start()
+        # keep reporting until everything scheduled was answered or timed out
+        while dispatcher.is_alive() or self.pending or self.backlog:
+            time.sleep(report_interval)
+            now = time.monotonic()
+            self.expire(now)
+            snap = self.snapshot(now - start)
+            self.timeline.append(snap)
+            print(json.dumps(snap), file=sys.stderr)
+        elapsed = time.monotonic() - start
+        self.skill.default_shutdown()
+        self.common_query.shutdown()
+        self.api.shutdown()
+        return self.report(elapsed, min(duration, elapsed))
+
+    def report(self, elapsed: float, duration: float) -> dict:
+        workloads = {}
+        for workload in WORKLOADS:
+            lats = self.latencies[workload]
+            workloads[workload] = {"completed": len(lats),
+                                   "unanswered": self.unanswered[workload],
+                                   "timeouts": self.timeouts[workload],
+                                   "p50": percentile(lats, 50),
+                                   "p95": percentile(lats, 95),
+                                   "p99": percentile(lats, 99),
+                                   "max": round(max(lats), 4) if lats else None}
+        completed = sum(w["completed"] for w in workloads.values())
+        with self.api.lock:
+            api_calls = dict(self.api.calls)
+        return {"sessions": self.n_sessions,
+                "target_rate": self.rate,
+                "achieved_rate": round(self.sent / duration, 2),
+                "duration": round(elapsed, 1),
+                "scheduled": self.scheduled,
+                "sent": self.sent,
+                "throughput": round(completed / elapsed, 2),
+                "api_calls": api_calls,
+                "workloads": workloads,
+                "timeline": self.timeline}
+
+
+def percentile(values: list, pct: float):
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)
+    return round(values[idx], 4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        epilog="intent and fallback requests skip ovos-core's intent matching "
+               "and fallback ordering, common_query goes through the real "
+               "common_query pipeline",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20,
+                        help="number of synthetic sessions, each asks one question at a time")
+    parser.add_argument("--rate", type=float, default=10,
+                        help="requests per second, scheduled whether or not earlier ones were answered")
+    parser.add_argument("--duration", type=float, default=30,
+                        help="seconds to run the load for")
+    parser.add_argument("--mix", default="1,3,1",
+                        help="relative weights of intent,common_query,fallback")
+    parser.add_argument("--timeout", type=float, default=10,
+                        help="seconds before a request counts as timed out")
+    parser.add_argument("--unique-queries", type=int, default=1000,
+                        help="size of the question pool, smaller means more cache hits")
+    parser.add_argument("--api-latency", type=float, default=0.5,
+                        help="mean seconds the stub api takes to answer")
+    parser.add_argument("--api-jitter", type=float, default=0.2,
+                        help="standard deviation of the stub api latency")
+    parser.add_argument("--report-interval", type=float, default=5,
+                        help="seconds between timeline snapshots")
+    args = parser.parse_args()
+
+    harness = LoadHarness(args.sessions, args.rate,
+                          [float(w) for w in args.mix.split(",")],
+                          args.timeout, args.unique_queries,
+                          args.api_latency, args.api_jitter)
+    print(json.dumps(harness.run(args.duration, args.report_interval), indent=2))
@@ -0,0 +1,27 @@
+import json
+import unittest
+from os import listdir
+from os.path import dirname, isfile, join
+
+from ovos_utils.bracket_expansion import expand_template
+
+ROOT = dirname(dirname(dirname(__file__)))
+
+
+class TestBundles(unittest.TestCase):
+    def test_bundles_match_locale(self):
+        # bundles take priority over locale/*.voc, run scripts/build_bundles.py
+        # after editing translations so they don't drift apart
+        bundles = join(ROOT, "res", "bundles")
+        for f in listdir(bundles):
+            lang = f.replace(".json", "")
+            with open(join(bundles, f)) as fi:
+                vocabs = json.load(fi)["vocabs"]
+            for name, voc in vocabs.items():
+                path = join(ROOT, "locale", lang, f"{name}.voc")
+                self.assertTrue(isfile(path), path)
+                with open(path) as fi:
+                    lines = [l.strip() for l in fi.read().split("\n")]
+                samples = set([e for l in lines if l and not l.startswith("#")
+                               for e in expand_template(l.lower()) if e])
+                self.assertEqual(samples, set(voc["samples"]), path)
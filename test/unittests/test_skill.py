@@ -1,8 +1,14 @@
 import json
+import os
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from time import sleep
+from unittest.mock import Mock
 
-from ovos_utils.messagebus import FakeBus
-from skill_ovos_wolfie import WolframAlphaSkill
+from ovos_utils.messagebus import FakeBus, Message
+from skill_ovos_wolfie import MAX_PROFILE_DURATION, WolframAlphaSkill
 from ovos_workshop.skills.common_query_skill import CommonQuerySkill
 
 
@@ -71,3 +77,152 @@ class TestSkill(unittest.TestCase):
                         f"{self.skill.skill_id}.deactivate"]
         for event in default_ovos:
             self.assertTrue(event in registered_events)
+
+    def test_common_query_deadline(self):
+        def slow_answer(*args, **kwargs):
+            sleep(1)
+            return "the answer is always 42"
+
+        self.skill.settings["cq_timeout"] = 0.5
+        self.skill.wolfie.spoken_answer = Mock(side_effect=slow_answer)
+
+        # deadline passes before wolfram answers
+        self.assertIsNone(self.skill.match_common_query("slow question", "en-us"))
+
+        # in-flight request finishes into the cache
+        sleep(1)
+        self.assertEqual(self.skill.match_common_query("slow question", "en-us"),
+                         ("the answer is always 42", 0.7))
+        self.assertEqual(self.skill.wolfie.spoken_answer.call_count, 1)
+
+    def test_common_query_deadline_cancels_queued(self):
+        def slow_answer(*args, **kwargs):
+            sleep(2)
+            return "the answer is always 42"
+
+        self.skill.settings["cq_timeout"] = 0.5
+        self.skill.wolfie.spoken_answer = Mock(side_effect=slow_answer)
+        self.skill._executor = ThreadPoolExecutor(max_workers=1)
+
+        # first question occupies the only worker, second is still queued
+        self.assertIsNone(self.skill.match_common_query("slow question", "en-us"))
+        self.assertIsNone(self.skill.match_common_query("queued question", "en-us"))
+        self.assertEqual([k[0] for k in self.skill._pending], ["slow question"])
+
+        # queued question never reached the api
+        sleep(2)
+        self.assertEqual(self.skill.wolfie.spoken_answer.call_count, 1)
+
+    def test_common_query_deadline_shared_question(self):
+        def slow_answer(*args, **kwargs):
+            sleep(1)
+            return "the answer is always 42"
+
+        self.skill.wolfie.spoken_answer = Mock(side_effect=slow_answer)
+        self.skill._executor = ThreadPoolExecutor(max_workers=1)
+        self.skill.ask_the_wolf_until("busy question", deadline=time.monotonic() + 0.1)
+
+        # a caller with time left still gets the answer when another gives up
+        answers = []
+        t = Thread(target=lambda: answers.append(self.skill.ask_the_wolf_until(
+            "shared question", deadline=time.monotonic() + 5)))
+        t.start()
+        sleep(0.1)
+        self.assertIsNone(self.skill.ask_the_wolf_until(
+            "shared question", deadline=time.monotonic() + 0.2))
+        t.join()
+        self.assertEqual(answers, ["the answer is always 42"])
+
+    def test_common_query_deadline_cached_repeat(self):
+        def slow_answer(*args, **kwargs):
+            sleep(1)
+            return "the answer is always 42"
+
+        self.skill.wolfie.spoken_answer = Mock(side_effect=slow_answer)
+        self.skill._executor = ThreadPoolExecutor(max_workers=1)
+        self.assertIsNone(self.skill.ask_the_wolf_until(
+            "slow question", deadline=time.monotonic() + 0.1))
+        sleep(1)
+
+        # answered from cache even while every worker is busy
+        self.skill.ask_the_wolf_until("busy question", deadline=time.monotonic() + 0.1)
+        self.assertEqual(self.skill.ask_the_wolf_until(
+            "slow question", deadline=time.monotonic() + 0.1),
+            "the answer is always 42")
+
+    def test_cq_timeout_setting(self):
+        self.skill.settings["cq_timeout"] = 3
+        self.assertEqual(self.skill.cq_timeout, 3)
+        self.skill.settings["cq_timeout"] = "soon"
+        default = self.skill.config_core.get("intents", {}).get(
+            "common_query", {}).get("max_response_wait", 6) - 1
+        self.assertEqual(self.skill.cq_timeout, max(default, 0.5))
+
+    def test_voc_bundle(self):
+        self.assertTrue(self.skill.voc_match("how do i install skills", "Help"))
+        self.assertFalse(self.skill.voc_match("installation", "Help"))
+        self.assertTrue(self.skill.voc_match("tell me more", "More", exact=True))
+        self.assertTrue(self.skill.voc_match("explica'm més", "More", lang="ca-es"))
+        # option templates are expanded, "(Vai|) avanti"
+        self.assertTrue(self.skill.voc_match("avanti", "More", lang="it-it"))
+        self.assertTrue(self.skill.voc_match("avanti", "More", lang="it-it", exact=True))
+        self.assertTrue(self.skill.voc_match("vorrei saperne di piu", "More", lang="it-it"))
+        self.assertIn("ca-es", self.skill._bundles)
+        self.assertIn("it-it", self.skill._bundles)
+        self.assertNotIn("de-de", self.skill._bundles)  # loaded lazily
+
+    def test_profile(self):
+        responses = []
+        self.bus.on(f"{self.skill.skill_id}.profile.response",
+                    lambda m: responses.append(m))
+        self.skill.wolfie.spoken_answer = Mock(side_effect=lambda *a, **k: sleep(1))
+
+        self.bus.emit(Message(f"{self.skill.skill_id}.profile",
+                              {"duration": 0.5, "top_n": 5}))
+        self.skill.ask_the_wolf("profiled question")
+        sleep(0.5)
+
+        self.assertEqual(len(responses), 1)
+        data = responses[0].data
+        self.assertTrue(os.path.isfile(data["path"]))
+        self.assertTrue(0 < len(data["summary"]) <= 5)
+        self.assertTrue(any("ask_the_wolf" in f["function"]
+                            for f in data["summary"]))
+
+    def test_profile_errors(self):
+        responses = []
+        self.bus.on(f"{self.skill.skill_id}.profile.response",
+                    lambda m: responses.append(m))
+
+        self.bus.emit(Message(f"{self.skill.skill_id}.profile",
+                              {"duration": "forever"}))
+        sleep(0.1)
+        self.assertEqual(responses[-1].data, {"error": "invalid duration or top_n"})
+
+        # huge durations are capped
+        self.bus.emit(Message(f"{self.skill.skill_id}.profile", {"duration": 1e9}))
+        sleep(0.1)
+        self.assertEqual(self.skill._profiler.duration, MAX_PROFILE_DURATION)
+
+        # only one capture at a time, the requester still gets a reply
+        self.bus.emit(Message(f"{self.skill.skill_id}.profile", {"duration": 1}))
+        sleep(0.1)
+        self.assertEqual(responses[-1].data, {"error": "profiler already running"})
+        self.skill._profiler.stop()
+
+    def test_profile_save_errors(self):
+        responses = []
+        self.bus.on(f"{self.skill.skill_id}.profile.response",
+                    lambda m: responses.append(m))
+
+        # back to back captures don't overwrite each other
+        for _ in range(2):
+            self.bus.emit(Message(f"{self.skill.skill_id}.profile", {"duration": 0.05}))
+            sleep(0.2)
+        self.assertNotEqual(responses[0].data["path"], responses[1].data["path"])
+
+        # unwritable data dir still gets a reply
+        self.skill.file_system.path = "/nonexistent/wolfie"
+        self.bus.emit(Message(f"{self.skill.skill_id}.profile", {"duration": 0.05}))
+        sleep(0.2)
+        self.assertTrue(responses[-1].data["error"].startswith("failed to save profile"))